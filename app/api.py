@@ -1,29 +1,71 @@
 from __future__ import annotations
+import asyncio
+import codecs
+import json
 import logging
-from datetime import datetime
+from collections import OrderedDict
 from uuid import UUID
 from fastapi import APIRouter, File, HTTPException, UploadFile 
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 
-from .db import insert_job, fetch_job
-from .schemas import CreateJobResponse, JobResultResponse, JobStatusResponse
-from .worker import job_queue
+from .db import fetch_job
+from .schemas import STATUS_ADAPTER, CreateJobResponse, JobResultResponse, JobStatusResponse
+from .worker import QueueFull, enqueue_job
 
-logging = logging.getLogger("text-jobs")
+try:
+    import orjson #optional C serializer for the hand-built payloads below
+    def _dumps(content) -> bytes:
+        return orjson.dumps(content)
+except ImportError:
+    def _dumps(content) -> bytes:
+        return json.dumps(content, separators=(",", ":")).encode()
+
+log = logging.getLogger("text-jobs")
 router = APIRouter()
 
 MAX_UPLOAD_BYTES = 1_000_000
+UPLOAD_CHUNK_BYTES = 64 * 1024
+RESULT_CACHE_MAX = 10_000
+
+#a done row never changes again (a late duplicate finish writes the same count), so its /result body is kept
+#and served without touching SQLite. failed is left out: a worker whose lease expired can still finish it as done.
+#insertion-ordered and capped: popitem(last=False) drops the oldest, and each call is atomic under the GIL
+_result_cache: "OrderedDict[UUID, bytes]" = OrderedDict()
+
+def _cache_result(job_id: UUID, content: bytes) -> Response:
+    _result_cache[job_id] = content
+    if len(_result_cache) > RESULT_CACHE_MAX:
+        try:
+            _result_cache.popitem(last=False)
+        except KeyError:
+            pass
+    return Response(content=content, media_type="application/json")
+
+async def _run(fn, *args):
+    #db.py is blocking sqlite3; async handlers hand it to a worker thread so the event loop keeps serving
+    return await asyncio.to_thread(fn, *args)
+
 @router.post("/jobs", response_model=CreateJobResponse, status_code=201)
-async def create_job(file=UploadFile=File(...)):
-    raw = await file.read()
-    if len(raw) > MAX_UPLOAD_BYTES:
-        raise HTTPException(status_code=413, detail="File is too large")
+async def create_job(file: UploadFile = File(...)):
+    #stream the upload: decode chunk by chunk and stop as soon as it is too large,
+    #instead of buffering the whole body as bytes and then again as str
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    parts = []
+    size = 0
     try:
-        text = raw.decode("utf-8")
+        while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+            size += len(chunk)
+            if size > MAX_UPLOAD_BYTES:
+                raise HTTPException(status_code=413, detail="File is too large")
+            parts.append(decoder.decode(chunk))
+        parts.append(decoder.decode(b"", final=True))
     except UnicodeDecodeError:
         raise HTTPException(status_code=400, detail="File must be UTF-8 encoded text")
-    job_id = insert_job(text)
-    job_queue.put(job_id)
+    text = "".join(parts)
+    try:
+        job_id = await _run(enqueue_job, text)
+    except QueueFull:
+        raise HTTPException(status_code=503, detail="Queue full, retry later")
     log.info("enqueued job %s", job_id)
     return CreateJobResponse(job_id=job_id, status="pending")
 
@@ -32,18 +74,22 @@ def get_status(job_id: UUID):
     row = fetch_job(job_id)
     if not row:
         raise HTTPException(status_code=404, detail="Job not found")
-    return JobStatusResponse(
+    body = JobStatusResponse(
         job_id=job_id,
-        status=row["status"]
-        created_at=datetime.fromisoformat(row["created_at"]),
-        updated_at=datetime.fromisoformat(row["updated_at"]),
+        status=row["status"],
+        created_at=row["created_at"],
+        updated_at=row["updated_at"],
         processing_by=row["processing_by"],
-        lease_until = (datetime.fromisoformat(row["lease_until"]))
-                        if row["lease_until"] else None,
+        lease_until=row["lease_until"],
     )
+    #already a validated model: hand FastAPI the bytes so it doesn't re-validate via response_model
+    return Response(content=STATUS_ADAPTER.dump_json(body), media_type="application/json")
 
 @router.get("/jobs/{job_id}/result", response_model=JobResultResponse)
 def get_result(job_id: UUID):
+    cached = _result_cache.get(job_id)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
     row = fetch_job(job_id)
     if not row:
         raise HTTPException(status_code=404, detail="Job not found")
@@ -64,6 +110,7 @@ def get_result(job_id: UUID):
             status_code=202,
             content={"job_id": str(job_id), "status": status, "message": "Result not ready"},
         )
-    return JobResultResponse(job_id=job_id, status=status, characters=int(rc))
+    #polled hardest of all endpoints: three scalars, so skip the model and write the JSON directly
+    return _cache_result(job_id, _dumps({"job_id": str(job_id), "status": status, "characters": int(rc)}))
 
     
\ No newline at end of file
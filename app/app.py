@@ -1,13 +1,32 @@
 from __future__ import annotations
 
+import asyncio
+import atexit
 import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from fastapi import FastAPI
 
 from .api import router
-from .db import init_db
-from .worker import start_workers
-
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+from .db import count_pending, init_db
+from .worker import CHAOS_ENABLED, start_checkpointer, start_workers, start_reaper
+
+try:
+    import uvloop #optional: libuv-backed event loop, cheaper per await than the stdlib one
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+except ImportError:
+    pass
+
+#handlers and worker threads only enqueue records; one listener thread does the stderr writes
+_log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s %(message)s",
+    handlers=[QueueHandler(_log_queue)],
+)
+_log_listener = QueueListener(_log_queue, logging.StreamHandler())
+_log_listener.start()
+atexit.register(_log_listener.stop)
 
 def create_app() -> FastAPI:
     app = FastAPI(title="Text Job Service (modular, pure SQL)", version="1.0.0")
@@ -16,14 +35,15 @@ def create_app() -> FastAPI:
     @app.on_event("startup")
     def _startup():
         init_db()
-        start_workers(n=3, crash_thread_index=0, crash_after_dequeues=2)  
+        start_workers(n=3, crash_thread_index=0, crash_after_dequeues=2 if CHAOS_ENABLED else None)
         start_reaper()
+        start_checkpointer()
 
 
 
     @app.get("/healthz")
     def healthz():
-        return {"status": "ok"}
+        return {"status": "ok", "pending": count_pending()} #backlog depth for autoscaling/alerts
 
     return app
 
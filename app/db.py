@@ -4,9 +4,9 @@ import threading
 import sqlite3
 import time
 from dataclasses import dataclass 
+from contextlib import contextmanager
 from queue import Queue 
-from datetime import datetime
-from typing import Optional, List
+from typing import ContextManager, Iterator, Optional, List
 from uuid import UUID, uuid4
 import logging
 from pathlib import Path
@@ -17,197 +17,313 @@ from pydantic import BaseModel
 from sqlmodel import SQLModel, Field, create_engine, Session, select
 
 
-#---logging----
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+#---logging---- (configured in app.py)
 log = logging.getLogger("text-jobs")
 
-DB_PATH = (Path(__file__).resolve().parent.parent./"jobs.db")
-STATUSES = ("pending", "started", "processing", "done", "failed")
+DB_PATH = (Path(__file__).resolve().parent.parent / "jobs.db")
+STATEMENT_CACHE_SIZE = 64 #prepared statements kept per pooled connection
 
-def get_conn() -> sqlite3.Connection: #a connection is created on every call
-    conn = sqlite3.connect(DB_PATH, isolation_level=None)  # autocommit mode 
-    conn.row_factory = sqlite3.Row #helps you access each column by name like rows["status"]
-    conn.execute("PRAGMA busy_timeout=3000") #if DB is locked by another write it waits for 3 seconds to error out 
-    return conn
+#---SQL----
+#sqlite3 caches compiled statements per connection keyed by the SQL text, so every
+#hot-path statement lives here as one constant and is parsed/planned once per connection
+_SQL_INSERT_META = (
+    "INSERT INTO jobs_meta (id, status, result_chars, attempts, last_error, created_at, updated_at) "
+    "VALUES (?, 'pending', NULL, 0, NULL, ?, ?)"
+)
+_SQL_INSERT_TEXT = "INSERT INTO jobs_text (id, text) VALUES (?, ?)"
+#everything the status/result endpoints read, but not the (up to 1MB) text payload
+_SQL_FETCH_JOB = (
+    "SELECT id, status, created_at, updated_at, processing_by, lease_until, "
+    "result_chars, attempts, last_error FROM jobs_meta WHERE id = ?"
+)
+_SQL_FETCH_TEXT = "SELECT text FROM jobs_text WHERE id=?"
+#length() stops at an embedded NUL where Python's len() doesn't, so those rows return NULL and the caller falls back
+_SQL_FETCH_TEXT_LENGTH = "SELECT CASE WHEN instr(text, char(0)) = 0 THEN length(text) END AS n FROM jobs_text WHERE id=?"
+_SQL_GET_ATTEMPTS = "SELECT attempts FROM jobs_meta WHERE id=?"
+_SQL_COUNT_PENDING = "SELECT count(*) FROM jobs_meta WHERE status='pending'"
+_SQL_RECORD_RETRY = """
+    UPDATE jobs_meta
+    SET attempts  = COALESCE(attempts, 0) + 1,
+        last_error =?,
+        status = 'pending',
+        lease_until = NULL,
+        processing_by = NULL,
+        updated_at = ?
+    WHERE id =?
+"""
+_SQL_RECORD_FAILED = """
+    UPDATE jobs_meta
+        SET last_error=?,
+        status='failed',
+        lease_until=NULL,
+        processing_by=NULL,
+        updated_at=?
+    WHERE id=?
+"""
+_SQL_FINISH_DONE = """
+    UPDATE jobs_meta
+       SET status='done',
+           result_chars=?,
+           lease_until=NULL,
+           processing_by=NULL,
+           updated_at=?
+     WHERE id=?
+"""
+_SQL_CLAIM_NEXT = """
+    UPDATE jobs_meta
+        SET status='started',
+            processing_by=?,
+            lease_until=?,
+            updated_at=?
+    WHERE id=(
+        SELECT id FROM jobs_meta
+        WHERE status='pending'
+        ORDER BY created_at
+        LIMIT 1
+    )
+    RETURNING id
+"""
+_SQL_EXTEND_LEASE = "UPDATE jobs_meta SET lease_until=?, updated_at=? WHERE id=?"
+_SQL_REAP_EXPIRED = """
+    UPDATE jobs_meta
+       SET status='pending',
+           lease_until=NULL,
+           processing_by=NULL,
+           updated_at=?
+     WHERE status IN ('started','processing')
+       AND lease_until < ?
+    RETURNING id
+"""
+
+class SqlitePool:
+    #connections opened once and shared by the API and worker threads, so no call pays
+    #connect + PRAGMA setup and the page cache stays warm between calls. Split into one
+    #writer and read-only readers: writes queue up here instead of spinning in busy_timeout,
+    #and WAL readers never wait behind them
+    def __init__(self, path: Path, size: int = 8):
+        self._writer: "Queue[sqlite3.Connection]" = Queue(maxsize=1)
+        self._writer.put(self._open(path))
+        self._readers: "Queue[sqlite3.Connection]" = Queue(maxsize=size - 1)
+        for _ in range(size - 1):
+            conn = self._open(path)
+            conn.execute("PRAGMA query_only=true") #a stray write on a reader fails loudly
+            self._readers.put(conn)
+
+    @staticmethod
+    def _open(path: Path) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            path,
+            isolation_level=None,  # autocommit mode
+            check_same_thread=False,  # used from the API and worker threads
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        conn.row_factory = sqlite3.Row #helps you access each column by name like rows["status"]
+        conn.execute("PRAGMA busy_timeout=3000") #if DB is locked by another write it waits for 3 seconds to error out
+        conn.execute("PRAGMA journal_mode=WAL") #this is write ahead logging mode
+        conn.execute("PRAGMA synchronous=NORMAL") #WAL only needs fsync at checkpoints
+        conn.execute("PRAGMA cache_size=-64000") #~64MB page cache per connection
+        conn.execute("PRAGMA wal_autocheckpoint=2000") #pages; checkpoint_wal() below also truncates on a timer
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA mmap_size=268435456") #read pages straight from a 256MB mapping
+        return conn
+
+    def acquire_writer(self) -> ContextManager[sqlite3.Connection]:
+        return self._borrow(self._writer)
+
+    def acquire_reader(self) -> ContextManager[sqlite3.Connection]:
+        return self._borrow(self._readers)
+
+    @staticmethod
+    @contextmanager
+    def _borrow(conns: "Queue[sqlite3.Connection]") -> Iterator[sqlite3.Connection]:
+        conn = conns.get() #blocks until a connection is free
+        try:
+            yield conn
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK") #never hand a half-done transaction to the next caller
+            raise
+        finally:
+            conns.put(conn)
+
+POOL: Optional[SqlitePool] = None #opened by init_db()
 
 def init_db() ->None:
-    with get_conn() as conn:
-        conn.execute("PRAGMA journal_mode=WAL;") #this is write ahead logging mode
+    global POOL
+    if POOL is None:
+        POOL = SqlitePool(DB_PATH)
+    with POOL.acquire_writer() as conn:
+        # job state lives apart from the uploaded text: status/lease updates and the
+        # reaper/claim scans only touch small jobs_meta rows, many to a page
         conn.execute(
             """
-            CREATE TABEL IF NOT EXISTS jobs(
-            id  CHAR(32) PRIMARY KEY,   --UUID hex (no hyphens)
-            status VARCHAR(20) NOTNULL,
-            text TEXT,
-            results_chars INTEGER, 
-            created_at TEXT NOTNULL,    -- ISO8601 (UTC)
-            updated_at TEXT NOTNULL
-            );
-
+            CREATE TABLE IF NOT EXISTS jobs_meta(
+            id  BLOB(16) PRIMARY KEY,   --UUID.bytes
+            status VARCHAR(20) NOT NULL,
+            result_chars INTEGER,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            processing_by TEXT,
+            lease_until INTEGER,         -- unix epoch seconds
+            created_at INTEGER NOT NULL, -- unix epoch seconds
+            updated_at INTEGER NOT NULL
+            ) WITHOUT ROWID
             """
         )
-        conn.execute("CREATE INDEX IF NOT EXISTS ix_jobs_status     ON jobs(status)")
-        conn.execute("CREATE INDEX IF NOT EXISTS ix_jobs_created_at ON jobs(created_at)")
-        conn.execute("CREATE INDEX IF NOT EXISTS ix_jobs_updated_at ON jobs(updated_at)")
-
-
-        # ---- add missing columns for retries/failures (safe on existing DBs) ----
-        cols = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)").fetchall()}
-        if "attempts" not in cols:
-            conn.execute("ALTER TABLE jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
-        if "last_error" not in cols:
-            conn.execute("ALTER TABLE jobs ADD COLUMN last_error TEXT")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs_text(
+            id  BLOB(16) PRIMARY KEY REFERENCES jobs_meta(id),
+            text TEXT
+            )
+            """
+        )
+        _migrate_legacy_jobs(conn)
 
-                cols = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)").fetchall()}
-        if "lease_until" not in cols:
-            conn.execute("ALTER TABLE jobs ADD COLUMN lease_until TEXT")
-        if "processing_by" not in cols:
-            conn.execute("ALTER TABLE jobs ADD COLUMN processing_by TEXT")
+        # index names carry the table: jobs.db is shared with main1.py, whose own "jobs" table has ix_jobs_* indexes,
+        # and CREATE INDEX IF NOT EXISTS would silently skip a name that is already taken there
+        for name in ("ix_jobs_created_at", "ix_jobs_updated_at", "ix_jobs_pending_created", "ix_jobs_lease_active"):
+            if conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='index' AND name=? AND tbl_name='jobs_meta'", (name,)
+            ).fetchone():
+                conn.execute(f"DROP INDEX {name}") #pre-rename copies on jobs_meta
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_jobs_meta_created_at ON jobs_meta(created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_jobs_meta_updated_at ON jobs_meta(updated_at)")
+        # partial index keeps the claim subselect a short range scan over pending rows only
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_jobs_meta_pending_created ON jobs_meta(created_at) WHERE status='pending'")
+        # same idea for the reaper: only leased rows are indexed, so the expiry check is a range scan
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_jobs_meta_lease_active ON jobs_meta(lease_until) WHERE status IN ('started','processing')")
 
-        now = _utcnow_iso()
+        now = _now()
         conn.execute(
             """
-            UPDATE jobs
+            UPDATE jobs_meta
                SET status='pending', lease_until=NULL, processing_by=NULL, updated_at=?
              WHERE status IN ('started','processing')
                AND (lease_until IS NULL OR lease_until < ?)
             """,
             (now, now),
         )
-def _utcnow_iso() -> str:
-    return datetime.utcnow().replace(microsecond=0).isoformat()
 
-def _plus_seconds_iso() -> str:
-    return (datetime.utcnow() + timedelta(seconds=sec)).replace(microsecond=0).isoformat()
+def _migrate_legacy_jobs(conn: sqlite3.Connection) -> None:
+    #older DBs of this package keep everything in one "jobs" table: copy its rows over once and keep the
+    #original as jobs_legacy. main1.py's SQLModel table in the same file is also called "jobs" but has no
+    #retry/lease columns, so it is left alone
+    cols = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)").fetchall()}
+    if not {"attempts", "lease_until"} <= cols:
+        return
+    def col(name: str, default: str = "NULL") -> str:
+        return name if name in cols else default #last_error/processing_by were added over time
+    def epoch(expr: str) -> str:
+        return f"CAST(strftime('%s', {expr}) AS INTEGER)" #legacy timestamps are ISO text
+    conn.create_function("uuid_blob", 1, _uuid_blob, deterministic=True)
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute(
+        f"""
+        INSERT OR IGNORE INTO jobs_meta
+            (id, status, result_chars, attempts, last_error, processing_by, lease_until, created_at, updated_at)
+        SELECT uuid_blob(id), status, result_chars, {col("attempts", "0")}, {col("last_error")},
+               {col("processing_by")}, {epoch(col("lease_until"))}, {epoch("created_at")}, {epoch("updated_at")}
+          FROM jobs
+        """
+    )
+    conn.execute("INSERT OR IGNORE INTO jobs_text (id, text) SELECT uuid_blob(id), text FROM jobs")
+    conn.execute("ALTER TABLE jobs RENAME TO jobs_legacy")
+    conn.execute("COMMIT")
+    log.info("copied legacy jobs table into jobs_meta/jobs_text (original kept as jobs_legacy)")
+
+def _uuid_blob(value):
+    #legacy ids are hex text; anything already stored as bytes passes through
+    return UUID(value).bytes if isinstance(value, str) else value
+
+def _now() -> int:
+    return int(time.time()) #unix epoch seconds, compared as plain integers
+
+def _plus_seconds(sec: int) -> int:
+    return _now() + sec
 
 
 def insert_job(text:str) -> UUID:
     job_uuid = uuid4()
-    now = _utcnow_iso()
-    with get_conn() as conn:
-        conn.execute(
-            "INSERT INTO jobs (id, status, text, result_chars, attempts, last_error, created_at, updated_at) "
-            "VALUES (?, 'pending', ?, NULL, 0, NULL, ?, ?)", 
-            (job_uuid.hex, text, now, now), 
-        )
+    now = _now()
+    with POOL.acquire_writer() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(_SQL_INSERT_META, (job_uuid.bytes, now, now))
+        conn.execute(_SQL_INSERT_TEXT, (job_uuid.bytes, text))
+        conn.execute("COMMIT")
     return job_uuid
 
-def fetch_job(job_id: UUID) -> Optional[sqlite3.row]:
-    with get_conn() as conn:
-        return conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id.hex,)).fetchone()
+def fetch_job(job_id: UUID) -> Optional[sqlite3.Row]:
+    with POOL.acquire_reader() as conn:
+        return conn.execute(_SQL_FETCH_JOB, (job_id.bytes,)).fetchone()
+
+#worker-side helpers take the raw 16-byte key (UUID.bytes) that the worker computes once per job;
+#UUID.bytes builds a new bytes object on every access
 
-def fetch_job_text(job_id: UUID) -> Optional[str]:
-    with get_conn() as conn:
-        row = conn.execute("SELECT text FROM jobs WHERE id=?",(job_id.hex,)).fetchone()
+def fetch_job_text(job_key: bytes) -> Optional[str]:
+    with POOL.acquire_reader() as conn:
+        row = conn.execute(_SQL_FETCH_TEXT, (job_key,)).fetchone()
         return None if row is None else (row["text"] or "")
 
-def update_status(job_id: UUID, new_status:str, result_chars: Optional[int] = None) -> None:
-    if new_status not in STATUSES:
-        raise ValueError("Invalid status")
-    now = _utcnow_iso()
-    with get_conn() as conn:
-        if results_chars is None:
-            conn.execute(
-                "UPDATE jobs SET status =?, updated_at=?, WHERE id =?",
-                (new_status, now, job_id.hex),
-            )
-        else:
-            conn.execute(
-                "UPDATE jobs SET status=?, results_chars=?, updated_at=?, WHERE id=?".
-                (new_status, int(result_chars), now, job_id.hex),
-            )
-    log.info("job %s-> %s%s", job_id, new_status, 
-            f"(result_chars={result_chars})" if result_chars is not None else ""
-    )
+def fetch_job_text_length(job_key: bytes) -> Optional[int]:
+    #character count computed inside SQLite: an int crosses into Python instead of up to 1 MB of text
+    with POOL.acquire_reader() as conn:
+        row = conn.execute(_SQL_FETCH_TEXT_LENGTH, (job_key,)).fetchone()
+        return None if row is None else row["n"]
+
+def count_pending() -> int:
+    #answered from the status='pending' partial index, so it costs one entry per waiting job
+    with POOL.acquire_reader() as conn:
+        return conn.execute(_SQL_COUNT_PENDING).fetchone()[0]
 
-def get_attempts(job_id: UUID) -> int:
-    with get_conn() as conn:
-        row = conn.execute("SELECT attempts FROM jobs WHERE id=?", (job_id.hex,)).fetchone()
+def checkpoint_wal() -> None:
+    #copy the WAL back into the main file and truncate it, so it stays small under steady writes
+    with POOL.acquire_writer() as conn:
+        busy, wal_pages, moved = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+    if busy:
+        log.info("wal checkpoint blocked by readers/writers (%d/%d pages moved)", moved, wal_pages)
+
+def get_attempts(job_key: bytes) -> int:
+    with POOL.acquire_reader() as conn:
+        row = conn.execute(_SQL_GET_ATTEMPTS, (job_key,)).fetchone()
         return 0 if row is None or row["attempts"] is None else int(row["attempts"])
 
-def record_retry(jon_id: UUID, error_text:str) -> None:
-    #Increment attempts, store last_error, set back the status to pending
-    now = _utcnow_iso()
-    with get_conn() as conn:
-        conn.execute(
-            """
-            UPDATE jobs
-            SET attempts  = COALESCE(attempts, 0) + 1,
-                last_error =?,
-                status = 'pending',
-                updated_at = ?, 
-            WHERE id =?
-            """,
-            (error_text[:1000], now, job_id.hex), 
-        )
+def finish_job_done(job_key: bytes, chars: int) -> None:
+    #terminal success: result + lease release in one write (one WAL commit instead of two)
+    now = _now()
+    with POOL.acquire_writer() as conn:
+        conn.execute(_SQL_FINISH_DONE, (int(chars), now, job_key))
 
-def record_failed(job_id: UUID, error_text:str) -> None:
-    #terminal failure at the current attempts count
-    now = _utcnow_iso()
-    with get_conn() as conn:
-        conn.execute(
-            """
-            UPDATE jobs
-                SET last_error=?,
-                status='failed',
-                updated_at=?
-            WHERE id=?
-            """,
-            (error_text[:2000], now, job_id.hex),
-        )
+def record_retry(job_key: bytes, error_text:str) -> None:
+    #Increment attempts, store last_error, release the lease, set back the status to pending
+    now = _now()
+    with POOL.acquire_writer() as conn:
+        conn.execute(_SQL_RECORD_RETRY, (error_text[:1000], now, job_key))
 
-def set_lease_started(job_id: UUID, processing_by: str, lease_seconds: int)->None:
-    now = _utcnow_iso()
-    until = _plus_seconds_iso(lease_seconds)
-    while get.conn() as conn:
-        conn.execute(
-            """
-            UPDATE jobs
-                SET status='started',
-                    processing_by=?,
-                    lease_until =?,
-                    updated_at=?
-            WHERE id=?
-            """,
-            (processing_by, unitl, now, job_id.hex),
-        )
-def extend_lease(job_id: UUID, lease_seconds: int) -> None:
-    now = _utcnow_iso()
-    until = _plus_seconds_iso(lease_seconds)
-    with get_conn() as conn:
-        conn.execute(
-            """
-            UPDATE jobs SELECT lease_until=?, updated_at=?, WHERE id=?
-            """,
-            (until, now, job_id.hex),
-        )
-def clear_lease(job_id: UUID) -> None:
-    with get_conn() as conn:
-        conn.execute(
-            """
-            UPDATE jobs SET lease_until=NULL, processing_by=NULL, updated_at=? WHERE id=?
-            """,
-            (_utcnow_iso(), job_id.hex),
-        )
+def record_failed(job_key: bytes, error_text:str) -> None:
+    #terminal failure at the current attempts count, lease released
+    now = _now()
+    with POOL.acquire_writer() as conn:
+        conn.execute(_SQL_RECORD_FAILED, (error_text[:2000], now, job_key))
 
-def reap_expired_ids(now_iso: str) -> List[str]:
-    with get_conn() as conn:
-        rows = conn.execute(
-            "SELECT id FROM jobs WHERE lease_until IS NOT NULL AND lease_until < ?",
-            (now_iso),
-        ).fetchall()
-    return [r["id"] for r in rows]
+def claim_next_job(processing_by: str, lease_seconds: int) -> Optional[UUID]:
+    #atomically take the oldest pending job and lease it to this worker (None when idle)
+    now = _now()
+    until = _plus_seconds(lease_seconds)
+    with POOL.acquire_writer() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute(_SQL_CLAIM_NEXT, (processing_by, until, now)).fetchall()
+        conn.execute("COMMIT")
+    return UUID(bytes=rows[0]["id"]) if rows else None
 
-def reset_to_pending(job_id_hex: str) -> None:
-    with get_conn() as conn:
-        conn.execute(
-            """
-            UPDATE jobs
-               SET status='pending',
-                   lease_until=NULL,
-                   processing_by=NULL,
-                   updated_at=?
-             WHERE id=?
-            """,
-            (_utcnow_iso(), job_id_hex),
-        )
+def extend_lease(job_key: bytes, lease_seconds: int) -> None:
+    now = _now()
+    until = _plus_seconds(lease_seconds)
+    with POOL.acquire_writer() as conn:
+        conn.execute(_SQL_EXTEND_LEASE, (until, now, job_key))
+
+def reap_and_reset(now: int) -> List[UUID]:
+    #every expired lease goes back to pending in one statement; returns the reclaimed ids
+    with POOL.acquire_writer() as conn:
+        rows = conn.execute(_SQL_REAP_EXPIRED, (now, now)).fetchall()
+    return [UUID(bytes=r["id"]) for r in rows]
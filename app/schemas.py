@@ -1,21 +1,32 @@
 from __future__ import annotations
 from datetime import datetime
+from typing import Optional
 from uuid import UUID
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, TypeAdapter
+
+#response-only models: never mutated, never fed unknown keys
+_RESPONSE_CONFIG = ConfigDict(extra="forbid", frozen=True)
 
 class CreateJobResponse(BaseModel):
+    model_config = _RESPONSE_CONFIG
     job_id: UUID
     status: str
  
 class JobStatusResponse(BaseModel):
+    model_config = _RESPONSE_CONFIG
     job_id : UUID
     status: str
+    #db columns are epoch-second ints; pydantic-core turns them into UTC datetimes itself
     created_at: datetime
     updated_at: datetime
     processing_by: Optional[str] = None
     lease_until: Optional[datetime] = None
     
 class JobResultResponse(BaseModel):
+    model_config = _RESPONSE_CONFIG
     job_id : UUID
     status: str 
     characters: int
+
+#built once at import; the status endpoint serializes straight to JSON bytes with it
+STATUS_ADAPTER = TypeAdapter(JobStatusResponse)
@@ -1,98 +1,147 @@
 from __future__ import annotations
 import logging
+import os
 import threading
 import time
 import random
-from queue import Queue 
+from typing import Optional
 from uuid import UUID
-from .db import fetch_job_text, update_status, get_attempts, record_retry, record_failed, set_lease_started, extend_lease, clear_lease, reap_expired_ids, reset_to_pending
+from .db import insert_job, count_pending, checkpoint_wal, fetch_job_text, fetch_job_text_length, finish_job_done, get_attempts, record_retry, record_failed, claim_next_job, extend_lease, reap_and_reset
 
 log = logging.getLogger("text-jobs")
 
-job_queue: "Queue[UUID]" = Queue()
+#fault injection for exercising retries/leases; off unless CHAOS=1, and `python -O` drops it entirely
+CHAOS_ENABLED = os.environ.get("CHAOS") == "1"
+AFTER_GET_FAIL_P = 0.10
+AFTER_STARTED_FAIL_P = 0.20
+DURING_PROCESS_FAIL_P = 0.15
+BEFORE_DONE_FAIL_P = 0.05
+SLOW_START_SEC = 0.5 #simulated latency, also CHAOS-only
+SLOW_WORK_SEC = 2.0
 
 MAX_RETRIES = 2
-LEASE_SEC = 5
+LEASE_SEC = 2 #real work is len(text); a crashed job is back to pending within a reaper tick or two
 REAPER_SEC = 5
+CHECKPOINT_SEC = 30
+POLL_MIN_SEC = 0.05 #idle workers back off from here...
+POLL_MAX_SEC = 2.0  #...up to this between empty claims
+MAX_PENDING = 1024  #backlog cap; beyond it new jobs are refused rather than queued
+
+_wake = threading.Event() #set whenever new pending rows may exist
 
 class SimulatedCrash(Exception):
     pass
 
+class QueueFull(Exception):
+    pass
+
+def enqueue_job(text: str) -> UUID:
+    #the row is the queue entry; the event only cuts an idle worker's backoff short
+    if count_pending() >= MAX_PENDING: #soft cap: concurrent uploads may overshoot it slightly
+        raise QueueFull(f"{MAX_PENDING} jobs already pending")
+    job_id = insert_job(text)
+    _wake.set()
+    return job_id
+
 def worker_loop(thread_index: int, crash_after_dequeues: Optional[int]=None)-> None:
     label = f"w-{thread_index+1}"
     log.info("worker %d started", thread_index+1)
     dequeues = 0
+    backoff = POLL_MIN_SEC
 
     while True:
-        job_id = job_queue.get()
+        job_id = claim_next_job(processing_by=label, lease_seconds=LEASE_SEC)
+        if job_id is None:
+            if _wake.wait(timeout=backoff):
+                _wake.clear()
+                backoff = POLL_MIN_SEC
+            else:
+                backoff = min(backoff * 2, POLL_MAX_SEC)
+            continue
+        backoff = POLL_MIN_SEC
         dequeues+=1
-        set_lease_started(job_id, processing_by=label, lease_seconds=LEASE_SEC)
+        key = job_id.bytes #one conversion per job, reused by every DB call below
         
-        if crash_after_dequeues is not None and thread_index == 0 and dequeues >= crash_after_dequeues:
+        if crash_after_dequeues is not None and dequeues >= crash_after_dequeues:
             log.error("Simulated crash in %s after %d dequeues (job %s)", label, dequeues, job_id)
             raise SimulatedCrash("boom")
 
         try:
-            if random.randint(1,1000) < 100: #(~10%)
+            if __debug__ and CHAOS_ENABLED and random.random() < AFTER_GET_FAIL_P:
                 raise Exception("Injected failure: after_get")
-            if random.randint(1, 1000) <= 200: #(~20%)
+            if __debug__ and CHAOS_ENABLED and random.random() < AFTER_STARTED_FAIL_P:
                 raise Exception("Injected failure: after_started")
 
-            time.sleep(0.5)
+            if __debug__ and CHAOS_ENABLED:
+                time.sleep(SLOW_START_SEC)
 
-            update_status(job_id, "processing")
-            if random.randint(1, 1000) <= 150: #(~15%)
+            if __debug__ and CHAOS_ENABLED and random.random() < DURING_PROCESS_FAIL_P:
                 raise Exception("Injected failure: during_processing")
 
-            text = fetch_job_text(job_id) or ""
-            time.sleep(2.0)
-            chars = len(text)
+            chars = fetch_job_text_length(key)
+            if chars is None: #NUL in the text (or no text row): count it in Python
+                chars = len(fetch_job_text(key) or "")
+            if __debug__ and CHAOS_ENABLED:
+                extend_lease(key, LEASE_SEC + int(SLOW_WORK_SEC)) #heartbeat so the slow path keeps its claim
+                time.sleep(SLOW_WORK_SEC)
 
-            if random.randint(1, 1000) <= 50: #(~5%)
+            if __debug__ and CHAOS_ENABLED and random.random() < BEFORE_DONE_FAIL_P:
                 raise Exception("Injected failure: before_done")
 
-            update_status(job_id, "done", result_chars=chars)
-            clear_lease(job_id)
+            finish_job_done(key, chars)
+            log.info("job %s-> done(result_chars=%d)", job_id, chars)
         
         except SimulatedCrash:
             raise
 
         except Exception as e:
             try:
-                attempts = get_attempts(job_id)
+                attempts = get_attempts(key)
             except Exception:
                 attempts=0
             if attempts < MAX_RETRIES:
-                record_retry(job_id, str(e))
-                job_queue.put(job_id)
+                record_retry(key, str(e)) #back to pending, the next free worker claims it
                 log.warning("job %s failed (failures=%d/%d) — requeued",
                             job_id, attempts + 1, MAX_RETRIES)
             else:
-                record_failed(job_id, str(e))
+                record_failed(key, str(e))
                 log.error("job %s failed permanently (failures=%d)", job_id, attempts)
 
-        finally:
-            job_queue.task_done()
-
 
 
 def reaper_loop() -> None:
     log.info("reaper started (interval=%ss)", REAPER_SEC)
     while True:
-        now_iso = datetime.utcnow().replace(microsecond=0).isoformat()
-        expired = reap_expired_ids(now_iso)
-        for idhex in expired:
-            reset_to_pending(idhex)                 # clear lease + set pending
-            job_queue.put(UUID(idhex))              # put back for workers
-            log.warning("reaper: returned expired job %s to queue", idhex)
+        expired = reap_and_reset(int(time.time()))  # clear lease + set pending, workers reclaim them
+        if expired:
+            _wake.set()
+            log.warning("reaper: returned %d expired job(s) to pending: %s", len(expired), ", ".join(map(str, expired)))
         time.sleep(REAPER_SEC)
 
+def checkpoint_loop() -> None:
+    log.info("checkpointer started (interval=%ss)", CHECKPOINT_SEC)
+    while True:
+        time.sleep(CHECKPOINT_SEC)
+        try:
+            checkpoint_wal()
+        except Exception:
+            log.exception("wal checkpoint failed")
+
 def start_workers(n: int, crash_thread_index: int = 0, crash_after_dequeues: Optional[int] = None) -> None:
     for i in range(n):
-        target = lambda i=1: worker_loop(i, crash_after_dequeues if i==crash_thread_index else None)
-        t = threading.Thread(target=target, name=f"joba_worker-{i+1}", daemon=True)
+        #args are bound per thread; the old `lambda i=1` default made every worker run as index 1
+        t = threading.Thread(
+            target=worker_loop,
+            args=(i, crash_after_dequeues if i == crash_thread_index else None),
+            name=f"joba_worker-{i+1}",
+            daemon=True,
+        )
         t.start()
 
 def start_reaper() -> None:
     t = threading.Thread(target=reaper_loop, name="reaper", daemon=True)
-    t.start()
\ No newline at end of file
+    t.start()
+
+def start_checkpointer() -> None:
+    t = threading.Thread(target=checkpoint_loop, name="checkpointer", daemon=True)
+    t.start()
@@ -1,10 +1,15 @@
 from __future__ import annotations
 
+import asyncio
+import codecs
+import itertools
+import os
+import random
 import threading
 import sqlite3
 import time
 from dataclasses import dataclass 
-from queue import Queue 
+from collections import OrderedDict, deque
 from datetime import datetime
 from typing import Optional, List
 from uuid import UUID, uuid4
@@ -15,6 +20,8 @@ from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from sqlmodel import SQLModel, Field, create_engine, Session, select
+from sqlalchemy import BLOB, Column, event
+from sqlalchemy.pool import QueuePool
 
 DB_PATH = Path(__file__).with_name("jobs.db")
 #---logging----
@@ -24,17 +31,28 @@ log = logging.getLogger("text-jobs")
 
 STATUSES = ("pending", "started", "processing", "done")
 MAX_UPLOAD_BYTES = 1_000_000 #~1 MB
+UPLOAD_CHUNK_BYTES = 64 * 1024
+DONE_CACHE_MAX = 10_000 #finished jobs kept in memory for polling clients
+
+#failure injection: off unless INJECT_FAILURES=1; INJECT_SEED makes a load-test run repeatable
+INJECT_FAILURES = os.environ.get("INJECT_FAILURES") == "1"
+PHASE1_FAIL_P = 0.3
+_rand = random.Random(os.environ.get("INJECT_SEED")).random #bound method: one C call per check, no randint range math
+
+#the real work is len(text); SIMULATE_WORK_SEC=2.5 brings back the old demo pacing (0.5s started + 2.0s processing)
+SIMULATE_WORK_SEC = float(os.environ.get("SIMULATE_WORK_SEC", "0"))
 
 
 #do not use orm just use native sql 
 class Job(SQLModel, table=True):
     __tablename__="jobs"
-    id: UUID = Field(default_factory=uuid4, primary_key=True, index=True)
-    status: str = Field(default="pending", index=True, max_length=20)
+    #UUID bytes, not 32-char hex: half the key size in the table and every index; converted to UUID only at the API edge
+    id: bytes = Field(default_factory=lambda: uuid4().bytes, sa_column=Column(BLOB(16), primary_key=True))
+    status: str = Field(default="pending", max_length=20)
     text: Optional[str]=Field(default=None)
     result_chars: Optional[int] = Field(default=None)
-    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
-    updated_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
 # default is for constants, by default the value is assigned to it 
 #default_factory means that call this function on initialization. This is for dynamic or mutable values
 #for example dynamic: uuid, datetime.utcnow , mutable: list, dict
@@ -42,53 +60,263 @@ class Job(SQLModel, table=True):
 
 
 #Engine and bootstrap
-engine = create_engine(f"sqlite:///{DB_PATH}", connect_args={"check_same_thread": False})
-#creates engine and returns DB engine 
-#Each request (and the worker) should still use its own Session(engine); don’t share Session objects across threads.
+N_WORKERS = 1
+DB_URL = f"sqlite:///{DB_PATH}"
+CHECKPOINT_SEC = 2.0
+STATEMENT_CACHE_SIZE = 64 #per-connection sqlite3 prepared-statement cache; the worker's constant SQL strings always hit it
+#one pooled connection for schema bootstrap and startup recovery; runtime writes go through the raw _writer below
+write_engine = create_engine(
+    DB_URL,
+    connect_args={"check_same_thread": False, "cached_statements": STATEMENT_CACHE_SIZE},
+    poolclass=QueuePool,
+    pool_size=1,
+    max_overflow=0,
+    pool_pre_ping=False,        #local file, nothing to ping
+)
+#long-lived read-only connections for the GET handlers and the worker's text fetch; under WAL they never wait on the writer
+read_engine = create_engine(
+    DB_URL,
+    connect_args={"check_same_thread": False, "cached_statements": STATEMENT_CACHE_SIZE},
+    poolclass=QueuePool,        #PRAGMAs run once per connection and the page cache stays hot
+    pool_size=8,
+    max_overflow=0,
+    pool_pre_ping=False,
+)
+#creates engines and returns DB engine 
+#Each request (and the worker) should still use its own Session(...); don’t share Session objects across threads.
+
+@event.listens_for(write_engine, "connect")
+@event.listens_for(read_engine, "connect")
+def _sqlite_pragmas(dbapi_conn, _record) -> None:
+    #runs once per new DBAPI connection: WAL so readers don't block the writer, and fsync only at checkpoints
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute("PRAGMA cache_size=-20000") #~20MB page cache
+    cur.execute("PRAGMA temp_store=MEMORY")
+    cur.execute("PRAGMA mmap_size=268435456")
+    cur.execute("PRAGMA busy_timeout=5000")
+    cur.execute("PRAGMA wal_autocheckpoint=0") #no inline checkpoints inside a commit; _checkpoint_loop does them
+    cur.close()
+
+@event.listens_for(read_engine, "connect")
+def _sqlite_read_only(dbapi_conn, _record) -> None:
+    dbapi_conn.execute("PRAGMA query_only=true") #a stray write through the read pool fails loudly
 
 def init_db() -> None:
-    SQLModel.metadata.create_all(engine)
+    global _writer
+    SQLModel.metadata.create_all(write_engine)
+    _migrate_hex_ids()
+    _ensure_indexes()
+    if _writer is None:
+        _writer = _open_writer()
+
+#the single runtime writer: a plain sqlite3 connection in autocommit mode, shared by the API insert and the workers.
+#no Session, identity map or pool checkout per statement; the lock keeps one statement on it at a time,
+#so writes queue up here instead of on SQLite's file lock
+_writer: Optional[sqlite3.Connection] = None
+_writer_lock = threading.Lock()
+
+def _open_writer() -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        DB_PATH, isolation_level=None, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE
+    )
+    _sqlite_pragmas(conn, None)
+    return conn
+
+def _write(sql: str, params: tuple) -> list:
+    with _writer_lock:
+        return _writer.execute(sql, params).fetchall() #drain RETURNING rows so the statement ends and autocommits
+
+def _migrate_hex_ids() -> None:
+    #one-shot: rows written before ids became BLOB(16) still hold GUID hex text; rewrite them in place
+    #(SQLite's unhex() needs 3.41+, so the conversion is a Python function registered on this connection)
+    conn = write_engine.raw_connection()
+    try:
+        conn.driver_connection.create_function("uuid_blob", 1, lambda s: UUID(s).bytes, deterministic=True)
+        conn.execute("UPDATE jobs SET id = uuid_blob(id) WHERE typeof(id) = 'text'")
+        conn.execute("DROP INDEX IF EXISTS ix_jobs_id") #the primary key is already unique and indexed
+        conn.commit()
+    finally:
+        conn.close()
+
+def _ensure_indexes() -> None:
+    #list_jobs (ORDER BY created_at DESC LIMIT n) is the only query that needs a secondary index, so one covering
+    #index serves it as an index-only scan; the old single-column ones only cost writes on every status update
+    conn = write_engine.raw_connection()
+    try:
+        for name in ("ix_jobs_status", "ix_jobs_created_at", "ix_jobs_updated_at"):
+            conn.execute(f"DROP INDEX IF EXISTS {name}")
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_jobs_list ON jobs(created_at DESC, id, status, result_chars, updated_at)"
+        ) #SQLite has no INCLUDE, so the covered columns ride in the key
+        conn.commit()
+    finally:
+        conn.close()
+
 
+QUEUE_IDLE_WAIT_SEC = 1.0 #idle consumers re-check this often even without a wakeup
 
+class JobQueue:
+    #one deque per worker instead of a single FIFO every worker blocks on:
+    #producers spread ids round-robin, each worker drains its own deque from the head and,
+    #when it runs dry, steals from a neighbour's tail. deque.append/popleft/pop are atomic
+    #under the GIL, so neither side takes a lock; a worker's Event is only set to wake it from idle.
+    def __init__(self, n_workers: int) -> None:
+        self._queues: "List[deque[UUID]]" = [deque() for _ in range(n_workers)]
+        self._wakes = [threading.Event() for _ in range(n_workers)]
+        self._next = itertools.count() #next() on a count is atomic, so the round-robin needs no lock
 
-job_queue: "Queue[UUID]" = Queue() # A fifo queue to that holds job_ids to be processed,
-#in memory fifo queue
-#"Queue[UUID]" this actually says that the queue items are of type UUID and it helps to check the parameter being passed
+    def put(self, item: UUID) -> None:
+        i = next(self._next) % len(self._queues)
+        self._queues[i].append(item)
+        wake = self._wakes[i]
+        if not wake.is_set(): #skip the Event's lock when a wakeup is already pending
+            wake.set()
+
+    def _take(self, worker: int) -> Optional[UUID]:
+        try:
+            return self._queues[worker].popleft()
+        except IndexError:
+            pass
+        n = len(self._queues)
+        for step in range(1, n):
+            try:
+                return self._queues[(worker + step) % n].pop() #steal the newest; the owner keeps FIFO order at the head
+            except IndexError:
+                continue
+        return None
+
+    def get(self, worker: int = 0) -> UUID:
+        wake = self._wakes[worker]
+        while True:
+            item = self._take(worker)
+            if item is not None:
+                return item
+            wake.clear()
+            if self._queues[worker]: #put() raced the clear; don't sleep on a non-empty deque
+                continue
+            wake.wait(timeout=QUEUE_IDLE_WAIT_SEC) #the timeout doubles as the steal poll for other workers' backlogs
+
+    def put_many(self, items: List[UUID]) -> None:
+        #one extend + at most one wakeup per worker, instead of a put() per id
+        n = len(self._queues)
+        first = next(self._next)
+        for step in range(min(n, len(items))):
+            i = (first + step) % n
+            self._queues[i].extend(items[step::n])
+            wake = self._wakes[i]
+            if not wake.is_set():
+                wake.set()
+
+    def task_done(self) -> None:
+        pass #nothing join()s on this queue; kept so callers written against queue.Queue still work
+
+    def qsize(self) -> int:
+        return sum(len(q) for q in self._queues)
+
+job_queue = JobQueue(N_WORKERS) #in-memory per-worker queues holding the job_ids to be processed
+
+#worker-path SQL: fixed strings run on raw DBAPI connections, so each one is parsed and planned once per
+#connection and then served from sqlite3's statement cache instead of being rebuilt by SQLAlchemy every call
+_SQL_UPDATE_STATUS = (
+    "UPDATE jobs SET status = ?, result_chars = COALESCE(?, result_chars), updated_at = ? WHERE id = ?"
+)
+#length() stops at an embedded NUL where len() doesn't, so those rows yield NULL and the caller counts in Python
+_SQL_START_PROCESSING = (
+    "UPDATE jobs SET status = 'processing', updated_at = ? WHERE id = ?"
+    " RETURNING CASE WHEN instr(text, char(0)) = 0 THEN length(text) END"
+)
+_SQL_FETCH_TEXT = "SELECT text FROM jobs WHERE id = ?"
+_SQL_RESET_UNFINISHED = "UPDATE jobs SET status = 'pending', updated_at = ? WHERE status IN ('started', 'processing')"
+_SQL_INSERT_JOB = (
+    "INSERT INTO jobs (id, status, text, result_chars, created_at, updated_at) VALUES (?, 'pending', ?, NULL, ?, ?)"
+)
+
+_now_cache = (0, "") #(epoch second, formatted); swapped as one tuple so readers never see a torn pair
+
+def _db_now() -> str:
+    #whole-second timestamps, formatted once per second instead of a datetime + strftime on every write;
+    #same text layout SQLAlchemy's DateTime writes and parses
+    global _now_cache
+    sec = int(time.time())
+    cached = _now_cache
+    if cached[0] != sec:
+        cached = (sec, datetime.utcfromtimestamp(sec).strftime("%Y-%m-%d %H:%M:%S.000000"))
+        _now_cache = cached
+    return cached[1]
 
 def _update_status(job_id: UUID, new_status: str, result_chars:Optional[int]=None) -> None:
     if new_status not in STATUSES:
         raise ValueError(f"Invalid Status:{new_status}")
-    with Session(engine) as session:
-        job = session.exec(select(Job).where(Job.id == job_id)).first()
-        # if not job:
-        #     return 
-        job.status = new_status
-        if result_chars is not None:
-            job.result_chars = result_chars
-        job.updated_at = datetime.utcnow()
-        session.add(job)
-        session.commit()
-        session.refresh(job)
+    #one native UPDATE on the writer connection: no ORM SELECT, object load or refresh per transition
+    _write(_SQL_UPDATE_STATUS, (new_status, result_chars, _db_now(), job_id.bytes))
     log.info("job %s -> %s", job_id, new_status)
-#flow of the above function validate status → 2) open session → 3) fetch job → 4) mutate fields → 5) commit.
+#flow of the above function validate status → 2) one autocommitted UPDATE (result_chars kept unless given).
+
+def _insert_job(text: str) -> UUID:
+    job_id = uuid4()
+    now = _db_now()
+    _write(_SQL_INSERT_JOB, (job_id.bytes, text, now, now))
+    return job_id
 
-def worker_loop() -> None:
-    log.info("worker started")
+def _start_processing(job_id: UUID) -> Optional[int]:
+    #status -> processing and the character count in one round-trip (UPDATE ... RETURNING);
+    #SQLite counts, so an int comes back instead of up to 1 MB of text
+    rows = _write(_SQL_START_PROCESSING, (_db_now(), job_id.bytes))
+    log.info("job %s -> processing", job_id)
+    return rows[0][0] if rows else None
+
+def _fetch_text(job_id: UUID) -> Optional[str]:
+    conn = read_engine.raw_connection()
+    try:
+        row = conn.execute(_SQL_FETCH_TEXT, (job_id.bytes,)).fetchone()
+    finally:
+        conn.close()
+    return None if row is None else row[0]
+
+def _requeue_unfinished() -> None:
+    #the queues live in memory, so jobs left pending/started/processing by a previous process would never run:
+    #reset them in one UPDATE and hand every pending id to the workers in one put_many
+    _write(_SQL_RESET_UNFINISHED, (_db_now(),))
+    with Session(read_engine) as session:
+        ids = [UUID(bytes=b) for b in session.exec(select(Job.id).where(Job.status == "pending").order_by(Job.created_at))]
+    if ids:
+        job_queue.put_many(ids)
+        log.info("requeued %d unfinished job(s)", len(ids))
+
+def _checkpoint_loop() -> None:
+    #with autocheckpoint off this is the only thing folding the WAL back into jobs.db; TRUNCATE also resets the file
+    #to zero bytes so reads don't have to search a long WAL. Runs on the bootstrap connection, idle at runtime.
+    log.info("checkpointer started (interval=%ss)", CHECKPOINT_SEC)
+    while True:
+        time.sleep(CHECKPOINT_SEC)
+        try:
+            conn = write_engine.raw_connection()
+            try:
+                busy, wal_pages, moved = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+            finally:
+                conn.close()
+            if busy:
+                log.info("wal checkpoint blocked by readers/writers (%d/%d pages moved)", moved, wal_pages)
+        except Exception:
+            log.exception("wal checkpoint failed")
+
+def worker_loop(worker: int = 0) -> None:
+    log.info("worker %d started", worker + 1)
     while True:
-        job_id = job_queue.get()
-        if random.randint(1,1000) < 300:
+        job_id = job_queue.get(worker)
+        if INJECT_FAILURES and _rand() < PHASE1_FAIL_P:
             raise Exception("Phase 1 failure")
         try:
             _update_status(job_id, "started")
-            time.sleep(0.5)
-            _update_status(job_id, "processing")
-            with Session(engine) as session:
-                job = session.exec(select(Job).where(Job.id == job_id)).first()
-                # if not job:
-                #     continue
-                text = job.text or ""
-            time.sleep(2.0)
-            chars = len(text)
+            if SIMULATE_WORK_SEC:
+                time.sleep(SIMULATE_WORK_SEC * 0.2)
+            chars = _start_processing(job_id)
+            if chars is None: #NUL in the text (or no text): count it in Python
+                chars = len(_fetch_text(job_id) or "")
+            if SIMULATE_WORK_SEC:
+                time.sleep(SIMULATE_WORK_SEC * 0.8)
             _update_status(job_id, "done", result_chars=chars)
         finally:
             job_queue.task_done() #look at this
@@ -123,8 +351,11 @@ app = FastAPI(title="Text Job Service", version="1.0.0")
 @app.on_event("startup")
 def on_startup():
     init_db()
-    t = threading.Thread(target=worker_loop, name="job-worker", daemon=True)
-    t.start()
+    _requeue_unfinished()
+    for i in range(N_WORKERS):
+        t = threading.Thread(target=worker_loop, args=(i,), name=f"job-worker-{i+1}", daemon=True)
+        t.start()
+    threading.Thread(target=_checkpoint_loop, name="checkpointer", daemon=True).start()
 
 @app.get("/healthz")
 def healthz():
@@ -135,68 +366,98 @@ def healthz():
 #response_model=CreateJobResponse makes FastAPI validate/shape the outgoing JSON.
 @app.post("/jobs", response_model=CreateJobResponse, status_code=201)
 async def create_job(file: UploadFile = File(...)):
-    raw = await file.read()
-    if len(raw) > MAX_UPLOAD_BYTES:
-        raise HTTPException(status_code = 413, detail="File too large max(1 MB)")
+    #decode chunk by chunk and stop at the size cap, instead of holding the whole upload as bytes and again as str
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    parts = []
+    size = 0
     try:
-        text = raw.decode("utf-8")
+        while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+            size += len(chunk)
+            if size > MAX_UPLOAD_BYTES:
+                raise HTTPException(status_code = 413, detail="File too large max(1 MB)")
+            parts.append(decoder.decode(chunk))
+        parts.append(decoder.decode(b"", final=True))
     except UnicodeDecodeError:
         raise HTTPException(status_code=400, detail="File must be UTF-8 encoded text")
-    with Session(engine) as session:
-        job = Job(status="pending",text=text)
-        session.add(job)
-        session.commit()
-        session.refresh(job)
-        job_id = job.id 
-
+    text = "".join(parts)
+    job_id = await asyncio.to_thread(_insert_job, text) #blocking SQLite off the event loop
     job_queue.put(job_id)
     log.info("enqueued job %s", job_id)
-    return CreateJobResponse(job_id=job.id, status="pending")
+    return CreateJobResponse(job_id=job_id, status="pending")
 
 @app.get("/jobs/{job_id}/status", response_model=JobStatusResponse)
 def get_status(job_id: UUID):
-    with Session(engine) as session:
-        job = session.exec(select(Job).where(Job.id == job_id)).first()
-        if not job:
-            raise HTTPException(status_code = 404, detail="Job Not found")
-        return JobStatusResponse(
-            job_id=job.id, status=job.status, created_at=job.created_at, updated_at=job.updated_at
-        )
+    view = _load_view(job_id)
+    if not view:
+        raise HTTPException(status_code = 404, detail="Job Not found")
+    return JobStatusResponse(
+        job_id=job_id, status=view.status, created_at=view.created_at, updated_at=view.updated_at
+    )
 
-@app.get("/jobs/{job_id}/result", response_model= JobResultResponse)
-def get_result(job_id: UUID):
-    with Session(engine) as session:
-        job = session.exec(select(Job).where(Job.id == job_id)).first()
-        if not job:
-            raise HTTPException(status_code = 404, detail="Job Not found")
-        if job.status != "done" or job.result_chars is None:
-            return JSONResponse(
-                status_code=202,
-                content={"job_id": str(job.id), "status": job.status, "message": "Result not ready"},
-            )
-        return JobResultResponse(job_id=job.id, status=job.status, characters=job.result_chars)
+#a done row never changes again, so its view is kept here and repeat polls skip SQLite entirely.
+#insertion-ordered and capped; get/set/popitem are each atomic under the GIL, so no lock is needed
+_done_cache: "OrderedDict[UUID, JobView]" = OrderedDict()
 
-@app.get("/jobs/{job_id}", response_model=JobView)
-def get_job(job_id: UUID):
-    with Session(engine) as session:
-        job = session.exec(select(Job).where(Job.id == job_id)).first()
+def _cache_if_done(view: JobView) -> JobView:
+    if view.status == "done" and view.result_chars is not None:
+        _done_cache[view.job_id] = view
+        if len(_done_cache) > DONE_CACHE_MAX:
+            try:
+                _done_cache.popitem(last=False) #drop the oldest
+            except KeyError:
+                pass
+    return view
+
+def _load_view(job_id: UUID) -> Optional[JobView]:
+    view = _done_cache.get(job_id)
+    if view is not None:
+        return view
+    with Session(read_engine) as session:
+        #plain column tuple: no Job instance, identity-map entry or (up to 1 MB) text load just to read four fields
+        job = session.exec(
+            select(Job.status, Job.created_at, Job.updated_at, Job.result_chars).where(Job.id == job_id.bytes)
+        ).first()
         if not job:
-            raise HTTPException(status_code=404, detail="Job not found")
-        return JobView(
-            job_id=job.id,
+            return None
+        return _cache_if_done(JobView(
+            job_id=job_id,
             status=job.status,
             created_at=job.created_at,
             updated_at=job.updated_at,
             result_chars=job.result_chars,
+        ))
+
+@app.get("/jobs/{job_id}/result", response_model= JobResultResponse)
+def get_result(job_id: UUID):
+    view = _load_view(job_id)
+    if not view:
+        raise HTTPException(status_code = 404, detail="Job Not found")
+    if view.status != "done" or view.result_chars is None:
+        return JSONResponse(
+            status_code=202,
+            content={"job_id": str(job_id), "status": view.status, "message": "Result not ready"},
         )
+    return JobResultResponse(job_id=job_id, status=view.status, characters=view.result_chars)
+
+@app.get("/jobs/{job_id}", response_model=JobView)
+def get_job(job_id: UUID):
+    view = _load_view(job_id)
+    if not view:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return view
 
 @app.get("/jobs", response_model=List[JobView])
 def list_jobs(limit: int = 20):
-    with Session(engine) as session:
-        rows = session.exec(select(Job).order_by(Job.created_at.desc()).limit(limit)).all()
+    with Session(read_engine) as session:
+        #only the columns ix_jobs_list carries, so the page is read from the index without touching the table (or text)
+        rows = session.exec(
+            select(Job.id, Job.status, Job.created_at, Job.updated_at, Job.result_chars)
+            .order_by(Job.created_at.desc())
+            .limit(limit)
+        ).all()
         return [
             JobView(
-                job_id=j.id,
+                job_id=UUID(bytes=j.id),
                 status=j.status,
                 created_at=j.created_at,
                 updated_at=j.updated_at,
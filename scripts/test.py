@@ -0,0 +1,71 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import logging
+import time
+from pathlib import Path
+
+import httpx
+
+log = logging.getLogger("client")
+
+try:
+    import h2  # noqa: F401  httpx only speaks HTTP/2 when the h2 extra is installed (pip install httpx[http2])
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+POLL_DELAY_SEC = 0.5
+POLL_LIMIT = 40
+
+async def create_job(client: httpx.AsyncClient, api: str, name: str, payload: bytes) -> str:
+    r = await client.post(f"{api}/jobs", files={"file": (name, payload, "text/plain")})
+    r.raise_for_status()
+    job_id = r.json()["job_id"]
+    log.info("created job %s", job_id)
+    return job_id
+
+async def poll_result(client: httpx.AsyncClient, api: str, job_id: str, delay: float, limit: int) -> dict:
+    for _ in range(limit):
+        r = await client.get(f"{api}/jobs/{job_id}/result")
+        if r.status_code in (200, 409): #done, or failed permanently
+            body = r.json()
+            log.info("job %s -> %s %s", job_id, r.status_code, body)
+            return body
+        if r.status_code != 202:
+            r.raise_for_status()
+        await asyncio.sleep(delay)
+    log.warning("job %s not finished after %d polls", job_id, limit)
+    return {"job_id": job_id, "status": "timeout"}
+
+async def main(args: argparse.Namespace) -> None:
+    file_path = Path(args.file)
+    payload = file_path.read_bytes() #read once, every upload reuses the same bytes
+    limits = httpx.Limits(max_connections=args.count, max_keepalive_connections=args.count)
+    started = time.perf_counter()
+    async with httpx.AsyncClient(http2=HTTP2, timeout=30.0, limits=limits) as client:
+        #all uploads in flight at once, then all pollers: wall clock is the slowest job, not the sum of them
+        job_ids = await asyncio.gather(*(create_job(client, args.api, file_path.name, payload) for _ in range(args.count)))
+        results = await asyncio.gather(*(poll_result(client, args.api, jid, args.delay, args.limit) for jid in job_ids))
+    elapsed = time.perf_counter() - started
+    done = sum(1 for r in results if r.get("status") == "done")
+    log.info("%d/%d jobs done in %.2fs (http2=%s)", done, args.count, elapsed, HTTP2)
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Upload a file as N jobs and wait for their results")
+    p.add_argument("--api", default="http://127.0.0.1:8000")
+    p.add_argument("--file", required=True)
+    p.add_argument("--count", type=int, default=3)
+    p.add_argument("--delay", type=float, default=POLL_DELAY_SEC, help="seconds between polls of one job")
+    p.add_argument("--limit", type=int, default=POLL_LIMIT, help="polls per job before giving up")
+    p.add_argument("--log", default=None, help="also write the client log to this file")
+    return p.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    handlers: list[logging.Handler] = [logging.StreamHandler()]
+    if args.log:
+        handlers.append(logging.FileHandler(args.log))
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s", handlers=handlers)
+    logging.getLogger("httpx").setLevel(logging.WARNING) #one line per request drowns the job log
+    asyncio.run(main(args))